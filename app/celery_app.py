@@ -1,6 +1,7 @@
 # app/celery_app.py
 
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 from app.config import settings
 
 celery = Celery(
@@ -13,8 +14,57 @@ celery = Celery(
 # Optionally add this line to retain connection retry behavior at startup:
 celery.conf.broker_connection_retry_on_startup = True
 
+# Compress task messages and results with zstd (kombu uses the zstandard package)
+celery.conf.task_compression = "zstd"
+celery.conf.result_compression = "zstd"
+
 # Set the default queue and routing so that tasks are enqueued on "document_processor"
 celery.conf.task_default_queue = 'document_processor'
+# CPU-bound work (PyMuPDF, hashing) goes to "cpu" for a prefork worker, tasks that
+# mostly wait on remote APIs go to "io" for a worker with a large thread pool.
 celery.conf.task_routes = {
+    "app.tasks.process_document.process_document": {"queue": "cpu"},
+    "app.tasks.embed_metadata_into_pdf.embed_metadata_into_pdf": {"queue": "cpu"},
+    "app.tasks.process_with_textract.process_with_textract": {"queue": "io"},
+    "app.tasks.refine_text_with_gpt.refine_text_with_gpt": {"queue": "io"},
+    "app.tasks.extract_metadata_with_gpt.extract_metadata_with_gpt": {"queue": "io"},
+    "app.tasks.convert_to_pdf.convert_to_pdf": {"queue": "io"},
+    "app.tasks.imap_tasks.pull_all_inboxes": {"queue": "io"},
+    "app.tasks.send_to_all.send_to_all_destinations": {"queue": "io"},
+    "app.tasks.upload_to_dropbox.upload_to_dropbox": {"queue": "io"},
+    "app.tasks.upload_to_nextcloud.upload_to_nextcloud": {"queue": "io"},
+    "app.tasks.upload_to_paperless.upload_to_paperless": {"queue": "io"},
+    "app.tasks.upload_to_paperless.poll_paperless_task": {"queue": "io"},
     "app.tasks.*": {"queue": "document_processor"},
 }
+
+# Tasks are long-running; don't let one worker reserve work others could start
+celery.conf.worker_prefetch_multiplier = 1
+
+
+@worker_process_init.connect
+def warm_up_worker_process(**kwargs):
+    """
+    Runs once in every worker child right after it is forked, so the first
+    task doesn't pay for PyMuPDF's import or the API client setup.
+    """
+    import fitz  # noqa: F401
+
+    from app.clients import (
+        get_openai_client,
+        get_document_intelligence_client,
+        get_http_session,
+    )
+
+    # Drop any client inherited from the parent and build one for this child
+    for get_client in (get_openai_client, get_document_intelligence_client, get_http_session):
+        get_client.cache_clear()
+        get_client()
+
+
+@worker_process_shutdown.connect
+def flush_worker_process_logs(**kwargs):
+    """Writes processing logs still queued in this child before it exits."""
+    from app.utils import flush_task_logs
+
+    flush_task_logs()
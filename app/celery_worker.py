@@ -18,15 +18,11 @@ from app.tasks.convert_to_pdf import convert_to_pdf
 
 # Import new send tasks
 from app.tasks.upload_to_dropbox import upload_to_dropbox
-from app.tasks.upload_to_paperless import upload_to_paperless
+from app.tasks.upload_to_paperless import upload_to_paperless, poll_paperless_task
 from app.tasks.upload_to_nextcloud import upload_to_nextcloud
 from app.tasks.imap_tasks import pull_all_inboxes
 from app.tasks.send_to_all import send_to_all_destinations
 
-celery.conf.task_routes = {
-    "app.tasks.*": {"queue": "default"},
-}
-
 @celery.task
 def test_task():
     return "Celery is working!"
@@ -0,0 +1,71 @@
+# app/clients.py
+
+from functools import lru_cache
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core.credentials import AzureKeyCredential
+from azure.ai.documentintelligence import DocumentIntelligenceClient
+
+from app.config import get_settings
+
+# Pooled connections kept per host by the shared HTTP session
+HTTP_POOL_SIZE = 32
+
+# Bytes read from a file body per socket send (http.client defaults to 8 KiB)
+HTTP_SEND_BLOCKSIZE = 1024 * 1024
+
+
+class LargeBlockHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections stream request bodies in large blocks."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["blocksize"] = HTTP_SEND_BLOCKSIZE
+        super().init_poolmanager(*args, **kwargs)
+
+
+@lru_cache(maxsize=1)
+def get_openai_client() -> openai.OpenAI:
+    """
+    Returns the OpenAI client shared by all tasks in this process.
+    Celery workers rebuild it in every prefork child (see app/celery_app.py),
+    so connection pools are never shared across a fork.
+    """
+    settings = get_settings()
+    return openai.OpenAI(
+        api_key=settings.openai_api_key,
+        base_url=settings.openai_base_url
+    )
+
+
+@lru_cache(maxsize=1)
+def get_document_intelligence_client() -> DocumentIntelligenceClient:
+    """Returns the Azure Document Intelligence client shared by all tasks in this process."""
+    settings = get_settings()
+    return DocumentIntelligenceClient(
+        endpoint=settings.azure_endpoint,
+        credential=AzureKeyCredential(settings.azure_ai_key)
+    )
+
+
+@lru_cache(maxsize=1)
+def get_http_session() -> requests.Session:
+    """
+    Returns the requests session used for Dropbox, Nextcloud and Paperless calls.
+    Keeping one session per process lets uploads reuse TLS connections
+    instead of paying for a new handshake every time.
+    """
+    # Only retry failed connection attempts: nothing was sent yet, so even
+    # uploads with a streamed body are safe to repeat
+    retry = Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.5)
+    adapter = LargeBlockHTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
 
-from pydantic_settings import BaseSettings
-from typing import Optional
+from functools import lru_cache
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Literal, Optional
 
 class Settings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        frozen=True,
+        extra="ignore",  # .env also carries keys read elsewhere (e.g. SESSION_SECRET)
+        validate_default=False,  # defaults are trusted literals, skip re-validating them
+    )
+
     admin_username: str
     admin_password: str
     aws_access_key_id: str
@@ -31,6 +39,10 @@ class Settings(BaseSettings):
     azure_endpoint: str
     gotenberg_url: str
     external_hostname: str = "localhost"  # Default to localhost
+    hash_mmap_threshold: int = 512 * 1024 * 1024  # Larger files are hashed by streaming instead of mmap
+    file_hash_algorithm: Literal["sha256", "blake3"] = "sha256"  # blake3 needs the optional blake3 package
+    db_pool_size: int = 5  # Pooled connections per process for non-SQLite databases
+    enable_db_task_log: bool = True  # Store task progress in processing_logs; False only logs it
     
     # Authentik
     authentik_client_id: Optional[str] = None
@@ -56,7 +68,15 @@ class Settings(BaseSettings):
     imap2_poll_interval_minutes: int = 10
     imap2_delete_after_process: bool = False
 
-    class Config:
-        env_file = ".env"
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Returns the process-wide Settings instance.
+    The .env file is parsed and validated only once per process.
+    """
+    return Settings()
+
+# Kept for existing `from app.config import settings` imports
+settings = get_settings()
+
@@ -3,7 +3,7 @@
 import os
 import logging
 
-from sqlalchemy import create_engine, exc
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.engine.url import make_url
@@ -16,19 +16,67 @@ Base = declarative_base()
 
 # Parse the DATABASE_URL
 DB_URL = settings.database_url
-engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
+IS_SQLITE = make_url(DB_URL).get_backend_name() == "sqlite"
+if IS_SQLITE:
+    engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
+else:
+    # Server databases: size the pool for the threads of one worker process
+    # and drop connections the server closed while they sat idle
+    engine = create_engine(
+        DB_URL,
+        pool_size=settings.db_pool_size,
+        max_overflow=2 * settings.db_pool_size,
+        pool_pre_ping=True,
+    )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Incremental schema changes for SQLite databases created by older models,
+# keyed by the PRAGMA user_version they bring the database to. Statements must
+# be idempotent: on a fresh database they run right after create_all().
+# create_all() runs on every start and adds new tables, but it never alters an
+# existing table, so new columns or indexes on one still need an entry here.
+SCHEMA_MIGRATIONS = {
+    2: [
+        "CREATE INDEX IF NOT EXISTS idx_plogs_task_ts ON processing_logs (task_id, timestamp DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_plogs_file_step ON processing_logs (file_id, step_name)",
+        "DROP INDEX IF EXISTS ix_processing_logs_task_id",
+    ],
+    3: [
+        "CREATE INDEX IF NOT EXISTS ix_files_created_at ON files (created_at)",
+    ],
+}
+SCHEMA_VERSION = max(SCHEMA_MIGRATIONS)
+
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        Applies per-connection SQLite settings when the pool opens a connection.
+        WAL + synchronous=NORMAL avoids an fsync on every commit; reads go
+        through a 256 MiB memory map and a 64 MiB page cache.
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-65536")  # negative = KiB
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
 
 def init_db():
     """
     Ensures the SQLite database file and its parent directory exist (if using sqlite).
     Then runs Base.metadata.create_all(bind=engine) to initialize tables.
     Logs a message if a new SQLite DB file is created.
+    On SQLite, pending SCHEMA_MIGRATIONS are applied in the same transaction;
+    only those are skipped when PRAGMA user_version already reports
+    SCHEMA_VERSION, so tables added to the models are still created.
     """
     # 1. Parse the DB URL to see if it's sqlite
     url = make_url(DB_URL)
-    if url.get_backend_name() == "sqlite":
+    if IS_SQLITE:
         # 2. Extract the database path from the URL
         database_path = url.database  # e.g. "/workdir/db/database.db" or ":memory:"
         
@@ -44,9 +92,21 @@ def init_db():
                 logger.info(f"Creating new SQLite database file at {database_path}")
                 open(database_path, "a").close()
     
-    # 5. Now create tables if they don't exist yet
+    # 5. Now create tables if they don't exist yet, all in one transaction
+    #    (pysqlite does not open one for DDL on its own, so BEGIN explicitly).
     try:
-        Base.metadata.create_all(bind=engine)
+        with engine.connect() as conn:
+            if IS_SQLITE:
+                version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+                conn.exec_driver_sql("BEGIN")
+            Base.metadata.create_all(bind=conn)
+            if IS_SQLITE and version < SCHEMA_VERSION:
+                for target_version in sorted(SCHEMA_MIGRATIONS):
+                    if target_version > version:
+                        for statement in SCHEMA_MIGRATIONS[target_version]:
+                            conn.exec_driver_sql(statement)
+                conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
         logger.info("Database initialization complete (tables created if not exist).")
     except exc.SQLAlchemyError as e:
         logger.error(f"Error initializing database: {e}")
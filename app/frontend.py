@@ -12,6 +12,9 @@ router = APIRouter()
 
 templates_dir = Path(__file__).parent.parent / "frontend" / "templates"
 templates = Jinja2Templates(directory=str(templates_dir))
+# Templates ship with the image; skip the per-render mtime check.
+# Compiled templates stay in Jinja's bounded LRU cache (400 entries by default).
+templates.env.auto_reload = False
 
 def get_db():
     db = SessionLocal()
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 import os
+import shutil
 
+from celery import group
 from fastapi import FastAPI, HTTPException, UploadFile, File, status, Request
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.config import Config
 from starlette.middleware.trustedhost import TrustedHostMiddleware
@@ -20,7 +22,7 @@ from app.tasks.upload_to_nextcloud import upload_to_nextcloud
 from app.tasks.send_to_all import send_to_all_destinations
 
 from app.api import router as api_router
-from app.frontend import router as frontend_router
+from app.frontend import router as frontend_router, templates
 from app.auth import router as auth_router
 
 # Load configuration from .env for the session key
@@ -53,53 +55,48 @@ app.mount("/static", StaticFiles(directory=frontend_static_dir), name="static")
 def on_startup():
     init_db()  # Create tables if they don't exist
 
-@app.post("/process/")
-def process(file_path: str):
+def _resolve_workdir_file(file_path: str, subdir: str = "") -> str:
     """
-    API Endpoint to start document processing.
-    This enqueues document processing which handles the full pipeline.
+    Resolves a relative 'file_path' against <workdir>/<subdir> and checks that
+    it exists with a single stat call.
+    Raises HTTPException(400) if the file is missing.
     """
     if not os.path.isabs(file_path):
-        file_path = os.path.join(settings.workdir, file_path)
-
-    if not os.path.exists(file_path):
+        file_path = os.path.join(settings.workdir, subdir, file_path)
+    try:
+        os.stat(file_path)
+    except OSError:
         raise HTTPException(
             status_code=400, detail=f"File {file_path} not found."
         )
+    return file_path
+
+@app.post("/process/")
+def process(file_path: str):
+    """
+    API Endpoint to start document processing.
+    This enqueues document processing which handles the full pipeline.
+    """
+    file_path = _resolve_workdir_file(file_path)
 
     task = process_document.delay(file_path)  # Updated function call
     return {"task_id": task.id, "status": "queued"}
 
 @app.post("/send_to_dropbox/")
 def send_to_dropbox(file_path: str):
-    if not os.path.isabs(file_path):
-        file_path = os.path.join(settings.workdir, 'processed', file_path)
-    if not os.path.exists(file_path):
-        raise HTTPException(
-            status_code=400, detail=f"File {file_path} not found."
-        )
+    file_path = _resolve_workdir_file(file_path, "processed")
     task = upload_to_dropbox.delay(file_path)
     return {"task_id": task.id, "status": "queued"}
 
 @app.post("/send_to_paperless/")
 def send_to_paperless(file_path: str):
-    if not os.path.isabs(file_path):
-        file_path = os.path.join(settings.workdir, 'processed', file_path)
-    if not os.path.exists(file_path):
-        raise HTTPException(
-            status_code=400, detail=f"File {file_path} not found."
-        )
+    file_path = _resolve_workdir_file(file_path, "processed")
     task = upload_to_paperless.delay(file_path)
     return {"task_id": task.id, "status": "queued"}
 
 @app.post("/send_to_nextcloud/")
 def send_to_nextcloud(file_path: str):
-    if not os.path.isabs(file_path):
-        file_path = os.path.join(settings.workdir, 'processed', file_path)
-    if not os.path.exists(file_path):
-        raise HTTPException(
-            status_code=400, detail=f"File {file_path} not found."
-        )
+    file_path = _resolve_workdir_file(file_path, "processed")
     task = upload_to_nextcloud.delay(file_path)
     return {"task_id": task.id, "status": "queued"}
 
@@ -108,13 +105,7 @@ def send_to_all_destinations_endpoint(file_path: str):
     """
     Call the aggregator task that sends this file to dropbox, nextcloud, and paperless.
     """
-    if not os.path.isabs(file_path):
-        file_path = os.path.join(settings.workdir, 'processed', file_path)
-
-    if not os.path.exists(file_path):
-        raise HTTPException(
-            status_code=400, detail=f"File {file_path} not found."
-        )
+    file_path = _resolve_workdir_file(file_path, "processed")
 
     task = send_to_all_destinations.delay(file_path)
     return {"task_id": task.id, "status": "queued", "file_path": file_path}
@@ -130,19 +121,22 @@ def process_all_pdfs_in_workdir():
             status_code=400, detail=f"Directory {target_dir} does not exist."
         )
 
-    pdf_files = []
-    for filename in os.listdir(target_dir):
-        if filename.lower().endswith(".pdf"):
-            pdf_files.append(filename)
+    with os.scandir(target_dir) as entries:
+        pdf_entries = [
+            entry for entry in entries
+            if entry.is_file() and entry.name.lower().endswith(".pdf")
+        ]
 
-    if not pdf_files:
+    if not pdf_entries:
         return {"message": "No PDF files found in that directory."}
 
-    task_ids = []
-    for pdf in pdf_files:
-        file_path = os.path.join(target_dir, pdf)
-        task = process_document.delay(file_path)  # Updated function call
-        task_ids.append(task.id)
+    pdf_files = [entry.name for entry in pdf_entries]
+
+    # Publish all tasks in one go instead of one broker round-trip per file
+    group_result = group(
+        process_document.s(entry.path) for entry in pdf_entries
+    ).apply_async()
+    task_ids = [result.id for result in group_result.results]
 
     return {
         "message": f"Enqueued {len(pdf_files)} PDFs to upload_to_s3",
@@ -150,15 +144,19 @@ def process_all_pdfs_in_workdir():
         "task_ids": task_ids
     }
 
+def _save_upload(upload: UploadFile, target_path: str):
+    """Copies the spooled upload to 'target_path' in 1 MiB blocks."""
+    with open(target_path, "wb") as f:
+        shutil.copyfileobj(upload.file, f, length=1024 * 1024)
+
 @app.post("/ui-upload")
 async def ui_upload(file: UploadFile = File(...)):
     """Endpoint to accept a user-uploaded file and enqueue it for processing."""
     workdir = "/workdir"
     target_path = os.path.join(workdir, file.filename)
     try:
-        with open(target_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # One thread-pool hop for the whole copy keeps the event loop free
+        await run_in_threadpool(_save_upload, file, target_path)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -172,8 +170,7 @@ async def ui_upload(file: UploadFile = File(...)):
 # For a dynamic 404 using the base layout, see "frontend/404.html" usage below:
 @app.exception_handler(404)
 async def custom_404_handler(request: Request, exc: HTTPException):
-    # Serve the 404 template directly
-    templates = Jinja2Templates(directory=str(frontend_static_dir.parent / "templates"))
+    # Serve the 404 template directly, using the shared frontend templates
     return templates.TemplateResponse(
         "404.html",
         {"request": request},
@@ -182,7 +179,6 @@ async def custom_404_handler(request: Request, exc: HTTPException):
 
 @app.exception_handler(500)
 async def custom_500_handler(request: Request, exc: Exception):
-    templates = Jinja2Templates(directory=str(frontend_static_dir.parent / "templates"))
     # Option 1: Keep it simple, just show a funny 500 message:
     return templates.TemplateResponse(
         "500.html",
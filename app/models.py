@@ -1,7 +1,7 @@
 # app/models.py
 #!/usr/bin/env python3
 
-from sqlalchemy import Column, String, Integer, DateTime, func, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, func, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from app.database import Base
 
@@ -35,15 +35,22 @@ class FileRecord(Base):
     # MIME type or extension (optional)
     mime_type = Column(String)
 
-    # Timestamp when we inserted this record
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Timestamp when we inserted this record (indexed for newest-first listings)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
 class ProcessingLog(Base):
     __tablename__ = "processing_logs"
     id = Column(Integer, primary_key=True, index=True)
     file_id = Column(Integer, ForeignKey("files.id"), nullable=True)  # Optional file association
-    task_id = Column(String, index=True)  # Celery task ID
+    task_id = Column(String)              # Celery task ID
     step_name = Column(String)           # e.g., "OCR", "convert_to_pdf", "upload_s3"
     status = Column(String)              # "pending", "in_progress", "success", "failure"
     message = Column(String, nullable=True)  # Error text or success note
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Log lookups are "latest entries for a task" and "steps for a file";
+        # the first index also covers plain task_id lookups.
+        Index("idx_plogs_task_ts", task_id, timestamp.desc()),
+        Index("idx_plogs_file_step", file_id, step_name),
+    )
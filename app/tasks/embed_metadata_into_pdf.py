@@ -1,30 +1,42 @@
 #!/usr/bin/env python3
 
 import os
-import shutil
+import tempfile
 import fitz  # PyMuPDF for PDF metadata editing
-import json
-from app.config import settings
+import orjson
+from app.config import get_settings
 from app.tasks.retry_config import BaseTaskWithRetry
-from app.tasks.finalize_document_storage import finalize_document_storage
 
 # Import the shared Celery instance
 from app.celery_app import celery
 
 def unique_filepath(directory, base_filename, extension=".pdf"):
     """
-    Returns a unique filepath in the specified directory.
-    If 'base_filename.pdf' exists, it will append an underscore and counter.
+    Claims and returns a unique filepath in the specified directory.
+    If 'base_filename.pdf' exists, it will append an underscore and the
+    smallest free counter. Each candidate is created exclusively as an empty
+    file, so concurrent callers can never be handed the same path; the caller
+    replaces the placeholder with the real file. On a collision the directory
+    is listed once and the counters are checked in memory instead of one stat
+    per candidate.
     """
     candidate = os.path.join(directory, base_filename + extension)
-    if not os.path.exists(candidate):
-        return candidate
-    counter = 1
+    taken = None
+    counter = 0
     while True:
-        candidate = os.path.join(directory, f"{base_filename}_{counter}{extension}")
-        if not os.path.exists(candidate):
-            return candidate
-        counter += 1
+        try:
+            fd = os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if taken is None:
+                with os.scandir(directory) as entries:
+                    taken = {entry.name for entry in entries}
+            counter += 1
+            while f"{base_filename}_{counter}{extension}" in taken:
+                counter += 1
+            candidate = os.path.join(directory, f"{base_filename}_{counter}{extension}")
+            continue
+        os.close(fd)
+        return candidate
 
 def persist_metadata(metadata, final_pdf_path):
     """
@@ -34,26 +46,39 @@ def persist_metadata(metadata, final_pdf_path):
     """
     base, _ = os.path.splitext(final_pdf_path)
     json_path = base + ".json"
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    with open(json_path, "wb") as f:
+        # orjson always emits UTF-8 (no ASCII escaping) and writes bytes directly
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
     return json_path
 
 @celery.task(base=BaseTaskWithRetry)
-def embed_metadata_into_pdf(local_file_path: str, extracted_text: str, metadata: dict):
+def embed_metadata_into_pdf(extraction: dict):
     """
     Embeds extracted metadata into the PDF's standard metadata fields.
+    Runs as a chain step after extract_metadata_with_gpt and receives its
+    result ({"s3_file": ..., "metadata": ...}); the returned dict is handed
+    on to finalize_document_storage.
     The mapping is as follows:
       - title: uses the extracted metadata "filename"
       - author: uses "absender" (or "Unknown" if missing)
       - subject: uses "document_type" (or "Unknown")
       - keywords: a comma‐separated list from the "tags" field
 
-    After processing, the file is moved to
+    The updated PDF is written directly to
       <workdir>/processed/<suggested_filename.pdf>
     where <suggested_filename.pdf> is derived from metadata["filename"].
-    The output PDF is saved incrementally while preserving its original encryption.
+    It is saved under a per-task temporary name in that directory and then
+    renamed onto an exclusively claimed name, preserving its original encryption.
     Additionally, the metadata is persisted to a JSON file with the same base name.
     """
+    settings = get_settings()
+
+    local_file_path = extraction.get("s3_file") if extraction else None
+    metadata = extraction.get("metadata") if extraction else None
+    if not local_file_path or not metadata:
+        print("[ERROR] No extracted metadata received, skipping embedding.")
+        return {"error": "No metadata to embed"}
+
     # Check for file existence; if not found, try the known shared tmp directory.
     if not os.path.exists(local_file_path):
         alt_path = os.path.join(settings.workdir, "tmp", os.path.basename(local_file_path))
@@ -63,56 +88,51 @@ def embed_metadata_into_pdf(local_file_path: str, extracted_text: str, metadata:
             print(f"[ERROR] Local file {local_file_path} not found, cannot embed metadata.")
             return {"error": "File not found"}
 
-    # Work on a safe copy in /tmp
-    tmp_dir = "/tmp"
     original_file = local_file_path
-    processed_file = os.path.join(tmp_dir, f"processed_{os.path.basename(local_file_path)}")
 
-    # Create a safe copy to work on
-    shutil.copy(original_file, processed_file)
+    # Use the suggested filename from metadata; if not provided, use the original basename.
+    suggested_filename = metadata.get("filename", os.path.splitext(os.path.basename(local_file_path))[0])
+    # Remove any extension and then add .pdf
+    suggested_filename = os.path.splitext(suggested_filename)[0]
+    # Define the final directory based on settings.workdir and ensure it exists.
+    final_dir = os.path.join(settings.workdir, "processed")
+    os.makedirs(final_dir, exist_ok=True)
+    # Write to a per-task file next to the final path so concurrent tasks never
+    # share it and the rename below never crosses devices.
+    fd, partial_file_path = tempfile.mkstemp(dir=final_dir, suffix=".pdf.tmp")
+    os.close(fd)
 
     try:
-        print(f"[DEBUG] Embedding metadata into {processed_file}...")
-
-        # Open the PDF
-        doc = fitz.open(processed_file)
-        # Set PDF metadata using only the standard keys.
-        doc.set_metadata({
-            "title": metadata.get("filename", "Unknown Document"),
-            "author": metadata.get("absender", "Unknown"),
-            "subject": metadata.get("document_type", "Unknown"),
-            "keywords": ", ".join(metadata.get("tags", []))
-        })
-        # Save incrementally and preserve encryption
-        doc.save(processed_file, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
-        doc.close()
-
-        print(f"[INFO] Metadata embedded successfully in {processed_file}")
-
-        # Use the suggested filename from metadata; if not provided, use the original basename.
-        suggested_filename = metadata.get("filename", os.path.splitext(os.path.basename(local_file_path))[0])
-        # Remove any extension and then add .pdf
-        suggested_filename = os.path.splitext(suggested_filename)[0]
-        # Define the final directory based on settings.workdir and ensure it exists.
-        final_dir = os.path.join(settings.workdir, "processed")
-        os.makedirs(final_dir, exist_ok=True)
-        # Get a unique filepath in case of collisions.
+        print(f"[DEBUG] Embedding metadata into {original_file}...")
+
+        # Open the original PDF; it is never modified in place
+        with fitz.open(original_file) as doc:
+            # Set PDF metadata using only the standard keys.
+            doc.set_metadata({
+                "title": metadata.get("filename", "Unknown Document"),
+                "author": metadata.get("absender", "Unknown"),
+                "subject": metadata.get("document_type", "Unknown"),
+                "keywords": ", ".join(metadata.get("tags", []))
+            })
+            # Write a fresh copy (no incremental save) and preserve encryption
+            doc.save(partial_file_path, encryption=fitz.PDF_ENCRYPT_KEEP)
+        # Claim a unique name only once the PDF is written, then move it over
+        # the placeholder: an atomic rename on the same filesystem, no data copy
         final_file_path = unique_filepath(final_dir, suggested_filename, extension=".pdf")
+        try:
+            os.replace(partial_file_path, final_file_path)
+        except OSError:
+            os.remove(final_file_path)
+            raise
 
-        # Move the processed file using shutil.move to handle cross-device moves.
-        shutil.move(processed_file, final_file_path)
-        # Ensure the temporary file is deleted if it still exists.
-        if os.path.exists(processed_file):
-            os.remove(processed_file)
+        print(f"[INFO] Metadata embedded successfully in {final_file_path}")
 
         # Persist the metadata into a JSON file with the same base name.
         json_path = persist_metadata(metadata, final_file_path)
         print(f"[INFO] Metadata persisted to {json_path}")
 
-        # Trigger the next step: final storage.
-        finalize_document_storage.delay(original_file, final_file_path, metadata)
-
-        # After triggering final storage, delete the original file if it is in workdir/tmp.
+        # The chain hands the result below to finalize_document_storage, which
+        # only needs the processed file, so the original can go now if it is in workdir/tmp.
         workdir_tmp = os.path.join(settings.workdir, "tmp")
         if original_file.startswith(workdir_tmp) and os.path.exists(original_file):
             try:
@@ -124,5 +144,8 @@ def embed_metadata_into_pdf(local_file_path: str, extracted_text: str, metadata:
         return {"file": final_file_path, "metadata_file": json_path, "status": "Metadata embedded"}
 
     except Exception as e:
-        print(f"[ERROR] Failed to embed metadata into {processed_file}: {e}")
+        print(f"[ERROR] Failed to embed metadata into {original_file}: {e}")
+        # Don't leave a half-written PDF behind in processed/
+        if os.path.exists(partial_file_path):
+            os.remove(partial_file_path)
         return {"error": str(e)}
@@ -1,42 +1,21 @@
 #!/usr/bin/env python3
 
-import json
-import re
-from app.config import settings
+import os
+from pathlib import Path
+
+import orjson
+from celery import chain
+from app.clients import get_openai_client
+from app.config import get_settings
 from app.tasks.retry_config import BaseTaskWithRetry
 from app.tasks.embed_metadata_into_pdf import embed_metadata_into_pdf
+from app.tasks.finalize_document_storage import finalize_document_storage
 
 # Import the shared Celery instance
 from app.celery_app import celery
-import openai
-
-# Initialize OpenAI client dynamically
-client = openai.OpenAI(
-    api_key=settings.openai_api_key,
-    base_url=settings.openai_base_url
-)
 
-def extract_json_from_text(text):
-    """
-    Try to extract a JSON object from the text.
-    - First, check for a JSON block inside triple backticks.
-    - If not found, try to extract text from the first '{' to the last '}'.
-    """
-    pattern = r"```(?:json)?\s*(\{.*?\})\s*```"
-    match = re.search(pattern, text, re.DOTALL)
-    if match:
-        return match.group(1)
-    else:
-        start = text.find("{")
-        end = text.rfind("}")
-        if start != -1 and end != -1 and end > start:
-            return text[start:end+1]
-    return None
-
-@celery.task(base=BaseTaskWithRetry)
-def extract_metadata_with_gpt(s3_filename: str, cleaned_text: str):
-    """Uses OpenAI to classify document metadata."""
-    prompt = f"""
+# Classification prompt, built once; {cleaned_text} is filled in per document.
+_PROMPT_TEMPLATE = """
 You are a specialized document analyzer trained to extract structured metadata from documents.
 Your task is to analyze the given text and return a well-structured JSON object.
 
@@ -68,10 +47,65 @@ Extracted text:
 Return only valid JSON with no additional commentary.
 """
 
+def _first_json_object(text, pos=0):
+    """
+    Returns the first balanced '{...}' span starting at or after 'pos', or None.
+    Single pass over the text; braces inside JSON strings are ignored.
+    """
+    start = text.find("{", pos)
+    if start == -1:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        c = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+def extract_json_from_text(text):
+    """
+    Try to extract a JSON object from the text.
+    - First, look for the object inside a triple-backtick block.
+    - If not found, take the first balanced object anywhere in the text.
+    """
+    fence = text.find("```")
+    if fence != -1:
+        json_text = _first_json_object(text, fence + 3)
+        if json_text:
+            return json_text
+    return _first_json_object(text)
+
+@celery.task(base=BaseTaskWithRetry)
+def extract_metadata_with_gpt(s3_filename: str, text_path: str):
+    """
+    Uses OpenAI to classify document metadata.
+    The document text is read from 'text_path' (written by metadata_pipeline)
+    rather than being passed through the broker; the file is removed once
+    metadata has been extracted.
+    The returned dict feeds embed_metadata_into_pdf as the next chain step.
+    """
     try:
+        cleaned_text = Path(text_path).read_text(encoding="utf-8")
+        prompt = _PROMPT_TEMPLATE.format(cleaned_text=cleaned_text)
+
         print(f"[DEBUG] Sending classification request for {s3_filename}...")
-        completion = client.chat.completions.create(
-            model=settings.openai_model,
+        completion = get_openai_client().chat.completions.create(
+            model=get_settings().openai_model,
             messages=[
                 {"role": "system", "content": "You are an intelligent document classifier."},
                 {"role": "user", "content": prompt}
@@ -87,14 +121,33 @@ Return only valid JSON with no additional commentary.
             print(f"[ERROR] Could not find valid JSON in GPT response for {s3_filename}.")
             return {}
 
-        metadata = json.loads(json_text)
+        metadata = orjson.loads(json_text)
         print(f"[DEBUG] Extracted metadata: {metadata}")
 
-        # Trigger the next step: embedding metadata into the PDF
-        embed_metadata_into_pdf.delay(s3_filename, cleaned_text, metadata)
+        os.remove(text_path)
 
         return {"s3_file": s3_filename, "metadata": metadata}
 
     except Exception as e:
         print(f"[ERROR] OpenAI classification failed for {s3_filename}: {e}")
         return {}
+
+def metadata_pipeline(s3_filename: str, cleaned_text: str):
+    """
+    Builds the post-OCR workflow for one document as a single Celery chain:
+      extract_metadata_with_gpt -> embed_metadata_into_pdf -> finalize_document_storage
+    Each step receives the previous step's result. Call .apply_async() to start it.
+
+    The text is written once to <workdir>/tmp/<name>.txt so only its path
+    travels through the broker.
+    """
+    text_path = os.path.join(
+        get_settings().workdir, "tmp", os.path.splitext(s3_filename)[0] + ".txt"
+    )
+    Path(text_path).write_text(cleaned_text, encoding="utf-8")
+
+    return chain(
+        extract_metadata_with_gpt.s(s3_filename, text_path),
+        embed_metadata_into_pdf.s(),
+        finalize_document_storage.s(),
+    )
@@ -10,11 +10,17 @@ from app.tasks.send_to_all import send_to_all_destinations
 
 
 @celery.task(base=BaseTaskWithRetry)
-def finalize_document_storage(original_file: str, processed_file: str, metadata: dict):
+def finalize_document_storage(embedding: dict):
     """
     Final storage step after embedding metadata.
+    Runs as the last chain step and receives embed_metadata_into_pdf's result.
     We will now call 'send_to_all_destinations' to push the final PDF to Dropbox/Nextcloud/Paperless.
     """
+    processed_file = embedding.get("file") if embedding else None
+    if not processed_file:
+        print(f"[ERROR] Nothing to finalize, previous step returned: {embedding}")
+        return {"status": "Skipped", "detail": embedding}
+
     print(f"[INFO] Finalizing document storage for {processed_file}")
 
     # 2) Enqueue uploads to all destinations (Dropbox, Nextcloud, Paperless)
@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 import os
-import json
 import email
+import email.policy
+import binascii
 import imaplib
 import logging
 import redis
 import re
+import orjson
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from celery import shared_task
 from app.config import settings
@@ -20,8 +25,30 @@ redis_client = redis.StrictRedis.from_url(settings.redis_url, decode_responses=T
 LOCK_KEY = "imap_lock"  # Unique key for locking
 LOCK_EXPIRE = 300       # Lock expires in 5 minutes
 
-# Local cache file for tracking processed emails
-CACHE_FILE = os.path.join(settings.workdir, "processed_mails.json")
+FETCH_BATCH_SIZE = 100  # Messages requested per IMAP FETCH command
+
+BASE64_CHUNK_SIZE = 64 * 1024  # Encoded characters decoded per write when saving attachments
+# Anything outside the base64 alphabet (line breaks, stray junk) is dropped before
+# regrouping, so 4-character groups stay aligned across chunks
+NON_BASE64_CHARS = re.compile(r"[^A-Za-z0-9+/=]")
+
+IMAP_TIMEOUT = 60  # Seconds before a socket operation on a reused connection gives up
+
+# Logged-in IMAP connections kept open between cycles, keyed by mailbox
+_imap_connections = {}
+
+# One lock per mailbox: a cached imaplib connection must never be used by two
+# pulls at once (e.g. a slow run overlapping the next one after the Redis lock
+# expired, on the threaded io worker)
+_mailbox_locks = {}
+_mailbox_locks_guard = threading.Lock()
+
+# Redis sorted set of processed Message-IDs, scored by processing time
+PROCESSED_KEY = "imap:processed"
+PROCESSED_RETENTION = 7 * 86400  # Forget entries after 7 days
+
+# Processed emails used to be tracked in this file; imported into Redis once
+LEGACY_CACHE_FILE = os.path.join(settings.workdir, "processed_mails.json")
 
 
 def acquire_lock():
@@ -41,36 +68,48 @@ def release_lock():
     logger.info("Lock released.")
 
 
-def load_processed_emails():
-    """Load the list of already processed emails from a local JSON file."""
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, "r") as f:
-                processed_emails = json.load(f)
-                processed_emails = cleanup_old_entries(processed_emails)
-                return processed_emails
-        except json.JSONDecodeError:
-            logger.warning("Failed to decode JSON, resetting processed emails cache.")
-            return {}
-    return {}
-
-
-def save_processed_emails(processed_emails):
-    """Save the processed email IDs to a local JSON file."""
-    with open(CACHE_FILE, "w") as f:
-        json.dump(processed_emails, f, indent=4)
-
-
-def cleanup_old_entries(processed_emails):
-    """Remove entries older than 7 days from the cache to avoid infinite growth."""
-    seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    valid_emails = {}
-    for msg_id, date_str in processed_emails.items():
-        naive_dt = datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S")
-        aware_dt = naive_dt.replace(tzinfo=timezone.utc)
-        if aware_dt > seven_days_ago:
-            valid_emails[msg_id] = date_str
-    return valid_emails
+def import_legacy_cache():
+    """
+    Moves entries from the old processed_mails.json cache into the Redis set,
+    so emails processed before the upgrade are not ingested again.
+    The file is renamed afterwards, so this only happens once.
+    """
+    if not os.path.exists(LEGACY_CACHE_FILE):
+        return
+    try:
+        with open(LEGACY_CACHE_FILE, "rb") as f:
+            legacy_emails = orjson.loads(f.read())
+    except orjson.JSONDecodeError:
+        logger.warning("Failed to decode legacy processed emails cache, ignoring it.")
+        legacy_emails = {}
+
+    # Legacy values are naive UTC ISO strings; epoch ints are taken as-is
+    cutoff = int(time.time()) - PROCESSED_RETENTION
+    entries = {}
+    for msg_id, value in legacy_emails.items():
+        if not isinstance(value, int):
+            try:
+                value = int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp())
+            except (TypeError, ValueError):
+                continue
+        if value > cutoff:
+            entries[msg_id] = value
+    if entries:
+        redis_client.zadd(PROCESSED_KEY, entries)
+    os.replace(LEGACY_CACHE_FILE, LEGACY_CACHE_FILE + ".migrated")
+    logger.info("Imported %d processed emails from %s into Redis.",
+                len(entries), LEGACY_CACHE_FILE)
+
+
+def cleanup_old_entries():
+    """Remove entries older than 7 days from the processed set to avoid infinite growth."""
+    cutoff = int(time.time()) - PROCESSED_RETENTION
+    redis_client.zremrangebyscore(PROCESSED_KEY, 0, cutoff)
+
+
+def is_processed_email(msg_id):
+    """Checks whether the Message-ID is in the processed set."""
+    return redis_client.zscore(PROCESSED_KEY, msg_id) is not None
 
 
 @shared_task
@@ -86,28 +125,37 @@ def pull_all_inboxes():
 
     try:
         logger.info("Starting pull_all_inboxes")
-
-        # Mailbox #1 (non-Gmail)
-        check_and_pull_mailbox(
-            mailbox_key="imap1",
-            host=settings.imap1_host,
-            port=settings.imap1_port,
-            username=settings.imap1_username,
-            password=settings.imap1_password,
-            use_ssl=settings.imap1_ssl,
-            delete_after_process=settings.imap1_delete_after_process,
-        )
-
-        # Mailbox #2 (Gmail)
-        check_and_pull_mailbox(
-            mailbox_key="imap2",
-            host=settings.imap2_host,
-            port=settings.imap2_port,
-            username=settings.imap2_username,
-            password=settings.imap2_password,
-            use_ssl=settings.imap2_ssl,
-            delete_after_process=settings.imap2_delete_after_process,
-        )
+        import_legacy_cache()
+        cleanup_old_entries()
+
+        mailboxes = [
+            # Mailbox #1 (non-Gmail)
+            dict(
+                mailbox_key="imap1",
+                host=settings.imap1_host,
+                port=settings.imap1_port,
+                username=settings.imap1_username,
+                password=settings.imap1_password,
+                use_ssl=settings.imap1_ssl,
+                delete_after_process=settings.imap1_delete_after_process,
+            ),
+            # Mailbox #2 (Gmail)
+            dict(
+                mailbox_key="imap2",
+                host=settings.imap2_host,
+                port=settings.imap2_port,
+                username=settings.imap2_username,
+                password=settings.imap2_password,
+                use_ssl=settings.imap2_ssl,
+                delete_after_process=settings.imap2_delete_after_process,
+            ),
+        ]
+
+        # Mailboxes are independent and mostly wait on the network, so pull them concurrently
+        with ThreadPoolExecutor(max_workers=len(mailboxes)) as executor:
+            futures = [executor.submit(check_and_pull_mailbox, **mailbox) for mailbox in mailboxes]
+            for future in futures:
+                future.result()
 
         logger.info("Finished pull_all_inboxes")
 
@@ -129,16 +177,62 @@ def check_and_pull_mailbox(
         logger.warning(f"Mailbox {mailbox_key} is missing config, skipping.")
         return
 
-    logger.info(f"Checking mailbox: {mailbox_key}")
-    pull_inbox(
-        mailbox_key=mailbox_key,
-        host=host,
-        port=port,
-        username=username,
-        password=password,
-        use_ssl=use_ssl,
-        delete_after_process=delete_after_process,
-    )
+    with _mailbox_locks_guard:
+        mailbox_lock = _mailbox_locks.setdefault(mailbox_key, threading.Lock())
+    if not mailbox_lock.acquire(blocking=False):
+        logger.warning("Mailbox %s is still being pulled by another run, skipping.", mailbox_key)
+        return
+
+    try:
+        logger.info(f"Checking mailbox: {mailbox_key}")
+        pull_inbox(
+            mailbox_key=mailbox_key,
+            host=host,
+            port=port,
+            username=username,
+            password=password,
+            use_ssl=use_ssl,
+            delete_after_process=delete_after_process,
+        )
+    finally:
+        mailbox_lock.release()
+
+
+def get_imap_connection(mailbox_key, host, port, username, password, use_ssl):
+    """
+    Returns a logged-in IMAP connection for the mailbox, reusing the one from the
+    previous cycle if the server still answers NOOP, so each poll doesn't pay
+    for a new TLS handshake and LOGIN.
+    Callers must hold the mailbox's lock (see check_and_pull_mailbox).
+    """
+    mail = _imap_connections.get(mailbox_key)
+    if mail is not None:
+        try:
+            if mail.noop()[0] == "OK":
+                return mail
+        except (imaplib.IMAP4.error, OSError):
+            pass
+        logger.info("Connection to %s went stale, reconnecting.", mailbox_key)
+        drop_imap_connection(mailbox_key)
+
+    if use_ssl:
+        mail = imaplib.IMAP4_SSL(host, port, timeout=IMAP_TIMEOUT)
+    else:
+        mail = imaplib.IMAP4(host, port, timeout=IMAP_TIMEOUT)
+    mail.login(username, password)
+    _imap_connections[mailbox_key] = mail
+    return mail
+
+
+def drop_imap_connection(mailbox_key):
+    """Logs out and forgets the cached connection for the mailbox, if any."""
+    mail = _imap_connections.pop(mailbox_key, None)
+    if mail is None:
+        return
+    try:
+        mail.logout()
+    except (imaplib.IMAP4.error, OSError):
+        pass
 
 
 def pull_inbox(mailbox_key, host, port, username, password, use_ssl,
@@ -155,11 +249,9 @@ def pull_inbox(mailbox_key, host, port, username, password, use_ssl,
     """
     logger.info("Connecting to %s at %s:%s (SSL=%s)",
                 mailbox_key, host, port, use_ssl)
-    processed_emails = load_processed_emails()
 
     try:
-        mail = imaplib.IMAP4_SSL(host, port) if use_ssl else imaplib.IMAP4(host, port)
-        mail.login(username, password)
+        mail = get_imap_connection(mailbox_key, host, port, username, password, use_ssl)
 
         is_gmail_host = "gmail" in host.lower()
         if is_gmail_host:
@@ -185,64 +277,156 @@ def pull_inbox(mailbox_key, host, port, username, password, use_ssl,
             logger.warning("Search failed on mailbox %s. Status=%s",
                            mailbox_key, status)
             mail.close()
-            mail.logout()
             return
 
         msg_numbers = search_data[0].split()
         logger.info("Found %d unread emails in %s.", len(msg_numbers), mailbox_key)
 
-        for num in msg_numbers:
-            status, msg_data = mail.fetch(num, "(RFC822)")
-            if status != "OK":
-                logger.warning("Failed to fetch message %s in %s. Status=%s",
-                               num, mailbox_key, status)
+        # First fetch only the Message-ID header (and Gmail labels) to filter out
+        # processed mail, then download full bodies for the rest. BODY.PEEK
+        # never sets \Seen, so the unread state needs no resetting afterwards.
+        header_items = "(BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)]"
+        header_items += " X-GM-LABELS)" if is_gmail_host else ")"
+        for batch in batched(msg_numbers, FETCH_BATCH_SIZE):
+            headers = fetch_messages(mail, batch, header_items)
+            if headers is None:
+                logger.warning("Failed to fetch headers %s..%s in %s.",
+                               batch[0], batch[-1], mailbox_key)
                 continue
 
-            raw_email = msg_data[0][1]
-            email_message = email.message_from_bytes(raw_email)
-            msg_id = email_message.get("Message-ID")
-
-            if not msg_id:
-                logger.warning("Skipping email without Message-ID in %s", mailbox_key)
-                continue
+            # Message-IDs and numbers of new mail in this batch; Redis and the
+            # flag updates are written once per batch
+            new_messages = {}
+            for num in batch:
+                if num not in headers:
+                    logger.warning("Message %s missing from FETCH response in %s",
+                                   num, mailbox_key)
+                    continue
+                fetch_meta, header_bytes = headers[num]
+                # compat32 keeps the literal header value, the dedup key used so far;
+                # the modern policy would rewrite non-conforming IDs
+                msg_id = email.message_from_bytes(header_bytes).get("Message-ID")
 
-            if msg_id in processed_emails:
-                logger.info("Skipping already processed email %s in %s", msg_id, mailbox_key)
-                continue
+                if not msg_id:
+                    logger.warning("Skipping email without Message-ID in %s", mailbox_key)
+                    continue
 
-            # For Gmail, check if the email already has the "Ingested" label.
-            if is_gmail_host:
-                if email_already_has_label(mail, num, "Ingested"):
-                    logger.info("Skipping email %s in %s, already labeled 'Ingested'.",
-                                msg_id, mailbox_key)
+                if msg_id in new_messages.values() or is_processed_email(msg_id):
+                    logger.info("Skipping already processed email %s in %s", msg_id, mailbox_key)
                     continue
 
-            # Process attachments (and convert non-PDF files).
-            # We call the function without assigning its return value since it is not used.
-            fetch_attachments_and_enqueue(email_message)
+                # For Gmail, check if the email already has the "Ingested" label.
+                if is_gmail_host:
+                    if has_gmail_label(fetch_meta, "Ingested"):
+                        logger.info("Skipping email %s in %s, already labeled 'Ingested'.",
+                                    msg_id, mailbox_key)
+                        continue
 
-            if is_gmail_host:
-                mark_as_processed_with_star(mail, num)
-                mark_as_processed_with_label(mail, num, label="Ingested")
+                new_messages[num] = str(msg_id)
 
-            processed_emails[msg_id] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
-            save_processed_emails(processed_emails)
+            if not new_messages:
+                continue
 
-            if delete_after_process:
-                logger.info("Deleting message %s from %s", num.decode(), mailbox_key)
-                mail.store(num, "+FLAGS", "\\Deleted")
-            else:
-                mail.store(num, "-FLAGS", "\\Seen")
+            fetched = fetch_messages(mail, list(new_messages), "(BODY.PEEK[])")
+            if fetched is None:
+                logger.warning("Failed to fetch messages %s..%s in %s.",
+                               batch[0], batch[-1], mailbox_key)
+                continue
+
+            newly_processed = {}
+            processed_nums = []
+            try:
+                for num, msg_id in new_messages.items():
+                    if num not in fetched:
+                        logger.warning("Message %s missing from FETCH response in %s",
+                                       num, mailbox_key)
+                        continue
+                    _, raw_email = fetched.pop(num)
+                    email_message = email.message_from_bytes(raw_email, policy=email.policy.default)
+                    # The parsed message holds its own copy; free the raw literal now
+                    del raw_email
+
+                    # Process attachments (and convert non-PDF files).
+                    # We call the function without assigning its return value since it is not used.
+                    fetch_attachments_and_enqueue(email_message)
+
+                    newly_processed[msg_id] = int(time.time())
+                    processed_nums.append(num)
+            finally:
+                # Record what was enqueued even if a later message in the batch failed,
+                # so those emails aren't ingested again next cycle
+                record_processed_batch(mail, mailbox_key, newly_processed, processed_nums,
+                                       is_gmail_host, delete_after_process)
 
         if delete_after_process:
             mail.expunge()
 
+        # Deselect the mailbox but stay logged in for the next cycle
         mail.close()
-        mail.logout()
         logger.info("Finished processing mailbox %s", mailbox_key)
 
     except Exception as e:
         logger.exception("Error pulling mailbox %s: %s", mailbox_key, e)
+        drop_imap_connection(mailbox_key)
+
+
+def record_processed_batch(mail, mailbox_key, newly_processed, processed_nums,
+                           is_gmail_host, delete_after_process):
+    """
+    Adds the batch's Message-IDs to the processed set and applies the flag
+    changes for its messages. STORE takes a sequence set, so each flag change
+    is one command per batch.
+    """
+    if not processed_nums:
+        return
+
+    redis_client.zadd(PROCESSED_KEY, newly_processed)
+
+    message_set = b",".join(processed_nums)
+    if is_gmail_host:
+        mark_as_processed_with_star(mail, message_set)
+        mark_as_processed_with_label(mail, message_set, label="Ingested")
+
+    if delete_after_process:
+        logger.info("Deleting messages %s from %s", message_set.decode(), mailbox_key)
+        mail.store(message_set, "+FLAGS", "\\Deleted")
+
+
+def batched(items, size):
+    """Yields consecutive slices of 'items' with at most 'size' entries."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def fetch_messages(mail, msg_numbers, fetch_items):
+    """
+    Fetches 'fetch_items' for several messages with a single FETCH command.
+    Returns {msg_number: (response_meta, raw_email)}, or None if the command failed.
+
+    imaplib returns one (meta, literal) tuple per message, optionally followed
+    by bare bytes with the rest of that message's response (e.g. b')' or
+    b' X-GM-LABELS (...))'); those are folded into the message's meta.
+    """
+    status, msg_data = mail.fetch(b",".join(msg_numbers), fetch_items)
+    if status != "OK":
+        return None
+
+    messages = {}
+    current = None
+    for item in msg_data:
+        if isinstance(item, tuple):
+            meta, raw_email = item
+            current = [meta, raw_email]
+            messages[meta.split(None, 1)[0]] = current
+        elif isinstance(item, bytes) and current is not None:
+            current[0] += item
+    return {num: (meta, raw_email) for num, (meta, raw_email) in messages.items()}
+
+
+def has_gmail_label(fetch_meta, label="Ingested"):
+    """Checks the X-GM-LABELS list contained in a FETCH response for 'label'."""
+    match = re.search(rb"X-GM-LABELS \(([^)]*)\)", fetch_meta)
+    return bool(match) and label.encode() in match.group(1)
 
 
 def fetch_attachments_and_enqueue(email_message):
@@ -306,8 +490,7 @@ def fetch_attachments_and_enqueue(email_message):
             continue
 
         file_path = os.path.join(settings.workdir, filename)
-        with open(file_path, "wb") as f:
-            f.write(part.get_payload(decode=True))
+        save_attachment(part, file_path)
 
         # If it's a PDF by MIME type or extension, process it directly
         if mime_type == "application/pdf" or is_pdf_by_extension:
@@ -322,28 +505,37 @@ def fetch_attachments_and_enqueue(email_message):
     return has_attachment
 
 
-def email_already_has_label(mail, msg_id, label="Ingested"):
+def save_attachment(part, file_path):
     """
-    Checks if the given message (msg_id) has the specified Gmail label.
-    Returns True if the label is found, False otherwise.
+    Writes the decoded body of an attachment to 'file_path'.
+    Base64 bodies are decoded in chunks straight into the file, so the decoded
+    attachment is never held in memory as a whole.
     """
+    if part.get("Content-Transfer-Encoding", "").strip().lower() != "base64":
+        with open(file_path, "wb") as f:
+            f.write(part.get_payload(decode=True) or b"")
+        return
+
+    encoded = part.get_payload()
     try:
-        # Convert msg_id to bytes if it's an integer
-        if isinstance(msg_id, int):
-            msg_id = str(msg_id).encode()
-            
-        label_status, label_data = mail.fetch(msg_id, "(X-GM-LABELS)")
-        if label_status == "OK" and label_data and len(label_data) > 0:
-            raw_labels = label_data[0][1].decode("utf-8", errors="ignore")
-            if label in raw_labels:
-                return True
-    except Exception as e:
-        logger.error("Failed to fetch labels for msg_id=%s: %s", msg_id, e)
-    return False
+        with open(file_path, "wb") as f:
+            pending = ""
+            for start in range(0, len(encoded), BASE64_CHUNK_SIZE):
+                pending += NON_BASE64_CHARS.sub("", encoded[start:start + BASE64_CHUNK_SIZE])
+                # Only decode whole 4-character groups, keep the rest for the next chunk
+                cut = len(pending) - len(pending) % 4
+                f.write(binascii.a2b_base64(pending[:cut]))
+                pending = pending[cut:]
+            if pending:
+                f.write(binascii.a2b_base64(pending + "=" * (-len(pending) % 4)))
+    except (binascii.Error, ValueError):
+        # Malformed base64; let the email package apply its lenient decoding
+        with open(file_path, "wb") as f:
+            f.write(part.get_payload(decode=True) or b"")
 
 
 def mark_as_processed_with_star(mail, msg_id):
-    """Stars the email in Gmail."""
+    """Stars the email in Gmail. 'msg_id' may be a comma-separated message set."""
     try:
         mail.store(msg_id, "+FLAGS", "\\Flagged")
         logger.info("Email %s starred in Gmail.", msg_id)
@@ -352,7 +544,7 @@ def mark_as_processed_with_star(mail, msg_id):
 
 
 def mark_as_processed_with_label(mail, msg_id, label="Ingested"):
-    """Adds a custom label to the email in Gmail."""
+    """Adds a custom label to the email in Gmail. 'msg_id' may be a comma-separated message set."""
     try:
         mail.store(msg_id, "+X-GM-LABELS", label)
         logger.info("Email %s labeled '%s' in Gmail.", msg_id, label)
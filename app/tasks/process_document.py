@@ -3,17 +3,16 @@
 import os
 import uuid
 import shutil
-import mimetypes
 import fitz  # PyMuPDF for checking embedded text
 
 from app.config import settings
 from app.tasks.retry_config import BaseTaskWithRetry
 from app.tasks.process_with_textract import process_with_textract
-from app.tasks.extract_metadata_with_gpt import extract_metadata_with_gpt
+from app.tasks.extract_metadata_with_gpt import metadata_pipeline
 from app.celery_app import celery
 from app.database import SessionLocal
 from app.models import FileRecord
-from app.utils import hash_file
+from app.utils import hash_file, detect_mime_type
 
 
 @celery.task(base=BaseTaskWithRetry)
@@ -22,7 +21,7 @@ def process_document(original_local_file: str):
     Process a document file and trigger appropriate text extraction.
 
     Steps:
-      1. Check if we have a FileRecord entry (via SHA-256 hash). If found, skip re-processing.
+      1. Check if we have a FileRecord entry (via hash_file's fingerprint (SHA-256 or BLAKE3)). If found, skip re-processing.
       2. If not found, insert a new DB row and continue with the pipeline:
          - Copy file to /workdir/tmp
          - Check for embedded text. If present, run local GPT extraction
@@ -37,9 +36,7 @@ def process_document(original_local_file: str):
     filehash = hash_file(original_local_file)
     original_filename = os.path.basename(original_local_file)
     file_size = os.path.getsize(original_local_file)
-    mime_type, _ = mimetypes.guess_type(original_local_file)
-    if not mime_type:
-        mime_type = "application/octet-stream"
+    mime_type = detect_mime_type(original_local_file)
 
     # Acquire DB session in the task
     with SessionLocal() as db:
@@ -80,23 +77,18 @@ def process_document(original_local_file: str):
         new_record.local_filename = new_local_path
         db.commit()
 
-    # 2. Check for embedded text (outside the DB session to avoid long open transactions)
-    pdf_doc = fitz.open(new_local_path)
-    has_text = any(page.get_text() for page in pdf_doc)
-    pdf_doc.close()
+    # 2. Extract embedded text in a single pass
+    #    (outside the DB session to avoid long open transactions)
+    with fitz.open(new_local_path) as pdf_doc:
+        pages_text = [page.get_text("text") for page in pdf_doc]
+    has_text = any(text.strip() for text in pages_text)
 
     if has_text:
         print(f"[INFO] PDF {original_local_file} contains embedded text. Processing locally.")
+        extracted_text = "\n".join(pages_text)
 
-        # Extract text locally
-        extracted_text = ""
-        pdf_doc = fitz.open(new_local_path)
-        for page in pdf_doc:
-            extracted_text += page.get_text("text") + "\n"
-        pdf_doc.close()
-
-        # Call metadata extraction directly
-        extract_metadata_with_gpt.delay(new_filename, extracted_text)
+        # Start the metadata extraction -> embedding -> storage chain
+        metadata_pipeline(new_filename, extracted_text).apply_async()
         return {"file": new_local_path, "status": "Text extracted locally"}
 
     # 3. If no embedded text, queue Textract processing
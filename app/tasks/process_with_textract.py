@@ -1,22 +1,15 @@
 import os
 import logging
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import AnalyzeOutputOption, AnalyzeResult
 
+from app.clients import get_document_intelligence_client
 from app.config import settings
 from app.tasks.retry_config import BaseTaskWithRetry
-from app.tasks.extract_metadata_with_gpt import extract_metadata_with_gpt
+from app.tasks.extract_metadata_with_gpt import metadata_pipeline
 from app.celery_app import celery
 
 logger = logging.getLogger(__name__)
 
-# Initialize Azure Document Intelligence client
-document_intelligence_client = DocumentIntelligenceClient(
-    endpoint=settings.azure_endpoint,
-    credential=AzureKeyCredential(settings.azure_ai_key)
-)
-
 @celery.task(base=BaseTaskWithRetry)
 def process_with_textract(s3_filename: str):
     """
@@ -28,7 +21,7 @@ def process_with_textract(s3_filename: str):
       2. Retrieves the processed PDF with embedded text.
       3. Saves the OCR-processed PDF locally in the same location as before.
       4. Extracts the text content for metadata processing.
-      5. Triggers downstream metadata extraction by calling extract_metadata_with_gpt.
+      5. Starts the downstream metadata pipeline (extract -> embed -> finalize).
     """
     try:
         tmp_file_path = os.path.join(settings.workdir, "tmp", s3_filename)
@@ -37,6 +30,8 @@ def process_with_textract(s3_filename: str):
 
         logger.info(f"Processing {s3_filename} with Azure Document Intelligence OCR.")
 
+        document_intelligence_client = get_document_intelligence_client()
+
         # Open and send the document for processing
         with open(tmp_file_path, "rb") as f:
             poller = document_intelligence_client.begin_analyze_document(
@@ -50,18 +45,24 @@ def process_with_textract(s3_filename: str):
             model_id=result.model_id, result_id=operation_id
         )
         searchable_pdf_path = tmp_file_path  # Overwrite the original PDF location
-        with open(searchable_pdf_path, "wb") as writer:
-            writer.writelines(response)
+        # Download next to it and rename over it, so a failed download can't truncate the original
+        partial_pdf_path = searchable_pdf_path + ".part"
+        # Write the response chunk by chunk as it arrives, through a 1 MiB buffer
+        with open(partial_pdf_path, "wb", buffering=1 << 20) as writer:
+            for chunk in response:
+                writer.write(chunk)
+        os.replace(partial_pdf_path, searchable_pdf_path)
         logger.info(f"Searchable PDF saved at: {searchable_pdf_path}")
 
         # Extract raw text content from the result
         extracted_text = result.content if result.content else ""
         logger.info(f"Extracted text for {s3_filename}: {len(extracted_text)} characters")
 
-        # Trigger downstream metadata extraction
-        extract_metadata_with_gpt.delay(s3_filename, extracted_text)
+        # Trigger downstream metadata extraction, embedding and storage
+        metadata_pipeline(s3_filename, extracted_text).apply_async()
 
-        return {"s3_file": s3_filename, "searchable_pdf": searchable_pdf_path, "cleaned_text": extracted_text}
+        # The text itself already went to the metadata pipeline; don't store it again in the result backend
+        return {"s3_file": s3_filename, "searchable_pdf": searchable_pdf_path}
     except Exception as e:
         logger.error(f"Error processing {s3_filename} with Azure Document Intelligence: {e}")
         raise
@@ -1,5 +1,6 @@
 # app/tasks/send_to_all.py
 
+from celery import group
 from app.celery_app import celery
 from app.tasks.upload_to_dropbox import upload_to_dropbox
 from app.tasks.upload_to_nextcloud import upload_to_nextcloud
@@ -9,13 +10,17 @@ from app.tasks.upload_to_paperless import upload_to_paperless
 def send_to_all_destinations(file_path: str):
     """
     Fires off tasks to upload a single file to Dropbox, Nextcloud, and Paperless.
-    These tasks run in parallel (Celery returns immediately from each .delay()).
+    The uploads are published as one group and run in parallel; the group id
+    can be used to track all three at once.
     """
-    upload_to_dropbox.delay(file_path)
-    upload_to_nextcloud.delay(file_path)
-    upload_to_paperless.delay(file_path)
+    result = group(
+        upload_to_dropbox.s(file_path),
+        upload_to_nextcloud.s(file_path),
+        upload_to_paperless.s(file_path),
+    ).apply_async()
 
     return {
         "status": "All upload tasks enqueued",
-        "file_path": file_path
+        "file_path": file_path,
+        "group_id": result.id,
     }
@@ -1,14 +1,35 @@
 #!/usr/bin/env python3
 
 import os
-import requests
+import redis
 import dropbox
+from dropbox.exceptions import AuthError
+from app.clients import get_http_session
 from app.config import settings
 from app.tasks.retry_config import BaseTaskWithRetry
 from app.celery_app import celery
 
+# Bytes sent per upload session request (Dropbox accepts up to 150 MiB)
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# Access tokens are cached in Redis so uploads don't refresh on every call
+redis_client = redis.StrictRedis.from_url(settings.redis_url, decode_responses=True)
+TOKEN_CACHE_KEY = "dbx:access_token"
+TOKEN_EXPIRY_MARGIN = 300  # Seconds before expiry at which a cached token is dropped
+
 def get_dropbox_access_token():
-    """Refresh the Dropbox access token using the stored refresh token from ENV."""
+    """Returns a cached Dropbox access token, refreshing it if none is cached."""
+    access_token = redis_client.get(TOKEN_CACHE_KEY)
+    if access_token:
+        return access_token
+    return refresh_dropbox_access_token()
+
+def invalidate_dropbox_access_token():
+    """Drops the cached access token, e.g. after Dropbox rejected it."""
+    redis_client.delete(TOKEN_CACHE_KEY)
+
+def refresh_dropbox_access_token():
+    """Refresh the Dropbox access token using the stored refresh token from ENV and cache it."""
 
     token_url = "https://api.dropbox.com/oauth2/token"
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
@@ -19,15 +40,46 @@ def get_dropbox_access_token():
         "client_secret": settings.dropbox_app_secret,
     }
 
-    response = requests.post(token_url, headers=headers, data=data)
+    response = get_http_session().post(token_url, headers=headers, data=data)
 
     if response.status_code == 200:
-        return response.json()["access_token"]
+        token_data = response.json()
+        access_token = token_data["access_token"]
+        expires_in = token_data.get("expires_in", 14400)
+        redis_client.set(TOKEN_CACHE_KEY, access_token,
+                         ex=max(60, expires_in - TOKEN_EXPIRY_MARGIN))
+        return access_token
     else:
         error_msg = f"Failed to refresh Dropbox token: {response.status_code} - {response.text}"
         print(f"[ERROR] {error_msg}")
         raise Exception(error_msg)
 
+def _upload_file(dbx, file_path: str, dropbox_path: str):
+    """Uploads the file in one request, or through an upload session if it is large."""
+    file_size = os.path.getsize(file_path)
+
+    # Unbuffered: each read goes straight into the chunk, no extra copy
+    with open(file_path, "rb", buffering=0) as file_data:
+        if file_size <= CHUNK_SIZE:
+            dbx.files_upload(file_data.read(), dropbox_path)
+        else:
+            upload_session_start_result = dbx.files_upload_session_start(file_data.read(CHUNK_SIZE))
+            offset = CHUNK_SIZE
+            cursor = dropbox.files.UploadSessionCursor(
+                session_id=upload_session_start_result.session_id,
+                offset=offset,
+            )
+            commit = dropbox.files.CommitInfo(path=dropbox_path)
+
+            while offset < file_size:
+                chunk = file_data.read(CHUNK_SIZE)
+                if file_size - offset <= CHUNK_SIZE:
+                    dbx.files_upload_session_finish(chunk, cursor, commit)
+                else:
+                    dbx.files_upload_session_append_v2(chunk, cursor)
+                offset += len(chunk)
+                cursor.offset = offset
+
 @celery.task(base=BaseTaskWithRetry)
 def upload_to_dropbox(file_path: str):
     """Uploads a file to Dropbox using the API."""
@@ -40,30 +92,14 @@ def upload_to_dropbox(file_path: str):
     dropbox_path = f"{settings.dropbox_folder}/{filename}"
 
     try:
-        # Get fresh access token
-        access_token = get_dropbox_access_token()
-        dbx = dropbox.Dropbox(access_token)
-
-        file_size = os.path.getsize(file_path)
-        chunk_size = 4 * 1024 * 1024  # 4MB chunk size
-
-        with open(file_path, "rb") as file_data:
-            if file_size <= chunk_size:
-                dbx.files_upload(file_data.read(), dropbox_path)
-            else:
-                upload_session_start_result = dbx.files_upload_session_start(file_data.read(chunk_size))
-                cursor = dropbox.files.UploadSessionCursor(
-                    session_id=upload_session_start_result.session_id,
-                    offset=file_data.tell(),
-                )
-                commit = dropbox.files.CommitInfo(path=dropbox_path)
-
-                while file_data.tell() < file_size:
-                    if (file_size - file_data.tell()) <= chunk_size:
-                        dbx.files_upload_session_finish(file_data.read(chunk_size), cursor, commit)
-                    else:
-                        dbx.files_upload_session_append_v2(file_data.read(chunk_size), cursor)
-                        cursor.offset = file_data.tell()
+        dbx = dropbox.Dropbox(get_dropbox_access_token(), session=get_http_session())
+        try:
+            _upload_file(dbx, file_path, dropbox_path)
+        except AuthError:
+            # The cached token was revoked or expired early; refresh it and retry once
+            invalidate_dropbox_access_token()
+            dbx = dropbox.Dropbox(refresh_dropbox_access_token(), session=get_http_session())
+            _upload_file(dbx, file_path, dropbox_path)
 
         print(f"[INFO] Successfully uploaded {filename} to Dropbox at {dropbox_path}.")
         return {"status": "Completed", "file": file_path}
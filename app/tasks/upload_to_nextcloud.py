@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 import os
-import requests
+from app.clients import get_http_session
 from app.config import settings
 from app.tasks.retry_config import BaseTaskWithRetry
 from app.celery_app import celery
@@ -19,9 +19,10 @@ def upload_to_nextcloud(file_path: str):
     # Construct the full upload URL
     nextcloud_url = f"{settings.nextcloud_upload_url}/{settings.nextcloud_folder}/{filename}"
 
-    # Read file content
+    # Stream the file: requests sends Content-Length from the file size and
+    # reads the body in blocks instead of loading it into memory
     with open(file_path, "rb") as file_data:
-        response = requests.put(
+        response = get_http_session().put(
             nextcloud_url,
             auth=(settings.nextcloud_username, settings.nextcloud_password),
             data=file_data
@@ -1,96 +1,136 @@
 #!/usr/bin/env python3
 
 import os
-import json
-import time
+import orjson
+import random
 import requests
 import logging
+from functools import lru_cache
+from requests_toolbelt.multipart.encoder import MultipartEncoder
 from typing import Dict, Any
 
+from app.clients import get_http_session
 from app.config import settings
 from app.tasks.retry_config import BaseTaskWithRetry
+from app.utils import log_task_progress
 from app.celery_app import celery
 
 logger = logging.getLogger(__name__)
 
-POLL_MAX_ATTEMPTS = 10
-POLL_INTERVAL_SEC = 3
+POLL_BASE_SEC = 1.0      # Backoff ceiling for the first poll
+POLL_CAP_SEC = 30.0      # Upper bound for the backoff ceiling
+POLL_MAX_RETRIES = 20    # Give up if Paperless hasn't finished after this many polls
 
+POLL_TIMEOUT_SEC = 10              # Timeout for a single /api/tasks/ request
+UPLOAD_TIMEOUT_SEC = (10, 300)     # (connect, read) timeout for posting a document
+
+# System randomness, so workers started together don't poll in lockstep
+_poll_random = random.SystemRandom()
+
+def _poll_delay(attempt: int) -> float:
+    """
+    Capped exponential backoff with full jitter for the given attempt number.
+    """
+    return _poll_random.uniform(0, min(POLL_CAP_SEC, POLL_BASE_SEC * 2 ** attempt))
+
+@lru_cache(maxsize=1)
 def _get_headers():
-    """Returns HTTP headers for Paperless-ngx API calls."""
+    """
+    Returns HTTP headers for Paperless-ngx API calls.
+    Built once per process (settings are frozen); callers must not mutate the dict.
+    """
     return {
         "Authorization": f"Token {settings.paperless_ngx_api_token}"
     }
 
+@lru_cache(maxsize=8)
 def _paperless_api_url(path: str) -> str:
     """
     Constructs a full Paperless-ngx API URL using `settings.paperless_host`.
     Ensures the path is appended with a leading slash if missing.
+    Each URL is built once per process.
     """
     host = settings.paperless_host.rstrip("/")
     if not path.startswith("/"):
         path = "/" + path
     return f"{host}{path}"
 
-def poll_task_for_document_id(task_id: str) -> int:
+def _fetch_paperless_task(task_id: str):
     """
-    Polls /api/tasks/?task_id=<uuid> until we get status=SUCCESS or FAILURE,
-    or until we run out of attempts.
+    Returns the /api/tasks/ entry for the Paperless task, or None if it isn't listed yet.
+    """
+    resp = get_http_session().get(
+        _paperless_api_url("/api/tasks/"), headers=_get_headers(), params={"task_id": task_id},
+        timeout=POLL_TIMEOUT_SEC,
+    )
+    resp.raise_for_status()
+    tasks_data = orjson.loads(resp.content)
+
+    if isinstance(tasks_data, dict) and "results" in tasks_data:
+        tasks_data = tasks_data["results"]
+    return tasks_data[0] if tasks_data else None
+
+# Not based on BaseTaskWithRetry: its autoretry would apply its own retry budget to
+# transient errors and re-poll definitive failures. Every non-terminal outcome
+# here goes through self.retry and counts against POLL_MAX_RETRIES.
+@celery.task(bind=True, max_retries=POLL_MAX_RETRIES)
+def poll_paperless_task(self, task_id: str, file_path: str) -> Dict[str, Any]:
+    """
+    Checks /api/tasks/?task_id=<uuid> once. While Paperless is still consuming,
+    the task re-schedules itself with a jittered exponential countdown instead
+    of sleeping, so no worker is blocked waiting.
 
     On SUCCESS: returns the int document_id from 'related_document'.
     On FAILURE: raises RuntimeError with the task's 'result' message.
-    If times out, raises TimeoutError.
+    If Paperless hasn't finished after POLL_MAX_RETRIES polls, raises TimeoutError
+    (or the last request error, if the final poll failed).
     """
-    url = _paperless_api_url("/api/tasks/")
-    attempts = 0
-
-    while attempts < POLL_MAX_ATTEMPTS:
-        try:
-            resp = requests.get(url, headers=_get_headers(), params={"task_id": task_id})
-            resp.raise_for_status()
-            tasks_data = resp.json()
-        except requests.exceptions.RequestException as exc:
-            logger.warning(
-                "Failed to poll for task_id='%s'. Attempt=%d Error=%s",
-                task_id, attempts + 1, exc
+    try:
+        task_info = _fetch_paperless_task(task_id)
+    except (requests.exceptions.RequestException, ValueError) as exc:
+        # Transient request or decoding error: poll again like a pending task
+        logger.warning("Failed to poll for task_id='%s'. Attempt=%d Error=%s",
+                       task_id, self.request.retries + 1, exc)
+        raise self.retry(countdown=_poll_delay(self.request.retries), exc=exc)
+    status = task_info.get("status") if task_info else None
+
+    if status == "SUCCESS":
+        doc_str = task_info.get("related_document")
+        if not doc_str:
+            raise RuntimeError(
+                f"Task {task_id} completed but no doc ID found. Task info: {task_info}"
             )
-            time.sleep(POLL_INTERVAL_SEC)
-            attempts += 1
-            continue
-
-        if isinstance(tasks_data, dict) and "results" in tasks_data:
-            tasks_data = tasks_data["results"]
-
-        if tasks_data:
-            task_info = tasks_data[0]
-            status = task_info.get("status")
-            if status == "SUCCESS":
-                doc_str = task_info.get("related_document")
-                if doc_str:
-                    return int(doc_str)
-                raise RuntimeError(
-                    f"Task {task_id} completed but no doc ID found. Task info: {task_info}"
-                )
-            elif status == "FAILURE":
-                raise RuntimeError(f"Task {task_id} failed: {task_info.get('result')}")
-
-        attempts += 1
-        time.sleep(POLL_INTERVAL_SEC)
-
-    raise TimeoutError(
-        f"Task {task_id} didn't reach SUCCESS within {POLL_MAX_ATTEMPTS} attempts."
+        doc_id = int(doc_str)
+        logger.info(f"Document {file_path} successfully ingested => ID={doc_id}")
+        log_task_progress(self.request.id, "upload_to_paperless", "success",
+                          message=f"paperless_task_id={task_id} paperless_document_id={doc_id}")
+        return {
+            "status": "Completed",
+            "paperless_task_id": task_id,
+            "paperless_document_id": doc_id,
+            "file_path": file_path
+        }
+    elif status == "FAILURE":
+        raise RuntimeError(f"Task {task_id} failed: {task_info.get('result')}")
+
+    raise self.retry(
+        countdown=_poll_delay(self.request.retries),
+        exc=TimeoutError(
+            f"Task {task_id} didn't reach SUCCESS within {POLL_MAX_RETRIES} polls."
+        ),
     )
 
-@celery.task(base=BaseTaskWithRetry)
-def upload_to_paperless(file_path: str) -> Dict[str, Any]:
+@celery.task(bind=True, base=BaseTaskWithRetry)
+def upload_to_paperless(self, file_path: str) -> Dict[str, Any]:
     """
     Uploads a PDF to Paperless with minimal metadata (filename and date only).
     
     1. Extracts the filename and date from the file.
     2. POSTs the PDF to Paperless => returns a quoted UUID string (task_id).
-    3. Polls /api/tasks/?task_id=<uuid> until SUCCESS or FAILURE => doc_id.
+    3. Schedules poll_paperless_task, which follows the Paperless task until
+       SUCCESS or FAILURE => doc_id.
 
-    Returns a dict with status, the paperless_task_id, paperless_document_id, and file_path.
+    Returns a dict with status, the paperless_task_id, the poll task id, and file_path.
     """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
@@ -100,14 +140,17 @@ def upload_to_paperless(file_path: str) -> Dict[str, Any]:
     # Upload the PDF
     post_url = _paperless_api_url("/api/documents/post_document/")
     with open(file_path, "rb") as f:
-        files = {
+        # Streams the multipart body from disk instead of building it in memory
+        body = MultipartEncoder(fields={
             "document": (base_name, f, "application/pdf"),
-        }
-        data = {"title": base_name}  # Title = Filename (no additional metadata)
+            "title": base_name,  # Title = Filename (no additional metadata)
+        })
+        headers = {**_get_headers(), "Content-Type": body.content_type}
 
         try:
             logger.debug("Posting document to Paperless: file=%s", base_name)
-            resp = requests.post(post_url, headers=_get_headers(), files=files, data=data)
+            resp = get_http_session().post(post_url, headers=headers, data=body,
+                                           timeout=UPLOAD_TIMEOUT_SEC)
             resp.raise_for_status()
         except requests.exceptions.RequestException as exc:
             logger.error(
@@ -119,13 +162,15 @@ def upload_to_paperless(file_path: str) -> Dict[str, Any]:
         raw_task_id = resp.text.strip().strip('"').strip("'")
         logger.info(f"Received Paperless task ID: {raw_task_id}")
 
-    # Poll tasks until success/fail => get doc_id
-    doc_id = poll_task_for_document_id(raw_task_id)
-    logger.info(f"Document {file_path} successfully ingested => ID={doc_id}")
+    log_task_progress(self.request.id, "upload_to_paperless", "in_progress",
+                      message=f"paperless_task_id={raw_task_id}")
+
+    # Follow the Paperless task without blocking this worker
+    poll = poll_paperless_task.apply_async((raw_task_id, file_path), countdown=POLL_BASE_SEC)
 
     return {
-        "status": "Completed",
+        "status": "Uploaded",
         "paperless_task_id": raw_task_id,
-        "paperless_document_id": doc_id,
+        "poll_task_id": poll.id,
         "file_path": file_path
     }
@@ -1,35 +1,177 @@
 # app/utils.py
+import os
+import mmap
+import time
+import queue
+import atexit
+import logging
 import hashlib
+import mimetypes
+import threading
+from datetime import datetime, timezone
+from app.config import settings
 from app.database import SessionLocal
 from app.models import ProcessingLog
 
-def hash_file(filepath, chunk_size=65536):
+logger = logging.getLogger(__name__)
+
+PDF_MAGIC = b"%PDF-"
+
+# Processing logs are queued and written by a background thread in batches
+LOG_BATCH_SIZE = 500       # Rows per INSERT batch
+LOG_FLUSH_INTERVAL = 0.1   # Seconds to wait for more rows before writing a batch
+LOG_FLUSH_TIMEOUT = 10     # Seconds flush_task_logs waits for the writer's in-flight batch
+
+_STOP_WRITER = object()    # Queue sentinel: the writer finishes its batch and exits
+
+_log_queue = queue.SimpleQueue()
+_log_writer = None
+_log_writer_lock = threading.Lock()
+
+
+def _hash_file_blake3(filepath):
+    """Returns the "blake3:"-prefixed BLAKE3 hash of the file, hashed with all cores."""
+    from blake3 import blake3  # Optional dependency, only needed when configured
+
+    return "blake3:" + blake3(max_threads=blake3.AUTO).update_mmap(filepath).hexdigest()
+
+
+def hash_file(filepath):
     """
-    Returns the SHA-256 hash of the file at 'filepath'.
-    Reads the file in chunks to handle large files efficiently.
+    Returns the fingerprint used to detect duplicate files: the SHA-256 hash of
+    the file at 'filepath', or its prefixed BLAKE3 hash if settings.file_hash_algorithm
+    is "blake3". The prefix keeps BLAKE3 values distinct from existing SHA-256 ones.
+    Files up to settings.hash_mmap_threshold are memory-mapped and hashed in a
+    single C-level call. Larger files, and files that can't be mapped, are
+    streamed through hashlib.file_digest, which also loops in C.
+    """
+    if settings.file_hash_algorithm == "blake3":
+        return _hash_file_blake3(filepath)
+
+    with open(filepath, "rb", buffering=0) as f:
+        if 0 < os.fstat(f.fileno()).st_size <= settings.hash_mmap_threshold:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if hasattr(mmap, "MADV_SEQUENTIAL"):
+                        # Let the kernel read ahead aggressively
+                        mm.madvise(mmap.MADV_SEQUENTIAL)
+                    return hashlib.sha256(mm).hexdigest()
+            except (ValueError, OSError):
+                # Non-regular files can't be mapped
+                pass
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def detect_mime_type(filepath):
+    """
+    Returns the MIME type of the file at 'filepath'.
+    PDFs are recognised by their magic bytes, everything else by extension.
     """
-    sha256 = hashlib.sha256()
     with open(filepath, "rb") as f:
-        while True:
-            data = f.read(chunk_size)
-            if not data:
+        if f.read(len(PDF_MAGIC)) == PDF_MAGIC:
+            return "application/pdf"
+    mime_type, _ = mimetypes.guess_type(filepath)
+    return mime_type or "application/octet-stream"
+
+
+def _write_logs(batch):
+    """Inserts a batch of ProcessingLog rows in a single transaction."""
+    with SessionLocal() as db:
+        db.bulk_insert_mappings(ProcessingLog, batch)
+        db.commit()
+
+
+def _drain_log_queue():
+    """
+    Background loop: collects queued log rows and writes them batch by batch.
+    Returns after writing its current batch once it takes _STOP_WRITER.
+    """
+    while True:
+        item = _log_queue.get()
+        if item is _STOP_WRITER:
+            return
+        batch = [item]
+        stop = False
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+        while len(batch) < LOG_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = _log_queue.get(timeout=timeout)
+            except queue.Empty:
                 break
-            sha256.update(data)
-    return sha256.hexdigest()
+            if item is _STOP_WRITER:
+                stop = True
+                break
+            batch.append(item)
+        try:
+            _write_logs(batch)
+        except Exception:
+            logger.exception("Failed to write %d processing log entries", len(batch))
+        if stop:
+            return
+
 
+def _ensure_log_writer():
+    """Starts the log writer thread for this process (threads don't survive a fork)."""
+    global _log_writer
+    if _log_writer is not None and _log_writer.is_alive():
+        return
+    with _log_writer_lock:
+        if _log_writer is None or not _log_writer.is_alive():
+            _log_writer = threading.Thread(
+                target=_drain_log_queue, name="processing-log-writer", daemon=True
+            )
+            _log_writer.start()
+
+
+def flush_task_logs():
+    """
+    Writes all queued log rows right away, e.g. before the process exits.
+    The writer thread is stopped first so the batch it is holding gets written
+    too; a later log_task_progress call starts a new one.
+    """
+    with _log_writer_lock:
+        writer = _log_writer
+        if writer is not None and writer.is_alive():
+            _log_queue.put(_STOP_WRITER)
+            writer.join(timeout=LOG_FLUSH_TIMEOUT)
+
+    batch = []
+    while True:
+        try:
+            item = _log_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is not _STOP_WRITER:
+            batch.append(item)
+    if batch:
+        _write_logs(batch)
+
+
+atexit.register(flush_task_logs)
 
 
 def log_task_progress(task_id, step_name, status, message=None, file_id=None):
     """
     Logs the progress of a Celery task to the database.
+    The row is queued and inserted by a background thread together with
+    other pending rows, so callers don't wait for a commit.
+    With settings.enable_db_task_log off, it only goes to the application log.
     """
-    with SessionLocal() as db:
-        log_entry = ProcessingLog(
-            task_id=task_id,
-            step_name=step_name,
-            status=status,
-            message=message,
-            file_id=file_id,
-        )
-        db.add(log_entry)
-        db.commit()
+    if not settings.enable_db_task_log:
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Task %s step %s: %s%s", task_id, step_name, status,
+                        f" ({message})" if message else "")
+        return
+
+    _log_queue.put({
+        "task_id": task_id,
+        "step_name": step_name,
+        "status": status,
+        "message": message,
+        "file_id": file_id,
+        "timestamp": datetime.now(timezone.utc),
+    })
+    _ensure_log_writer()
@@ -0,0 +1,45 @@
+import unittest
+
+import orjson
+
+from app.tasks.extract_metadata_with_gpt import extract_json_from_text
+
+
+class TestExtractJsonFromText(unittest.TestCase):
+    def test_json_inside_fence(self):
+        """Test that the object inside a ```json fence is returned"""
+        text = 'Here is the result: {not this}\n```json\n{"filename": "2024-01-01_Invoice"}\n```\nDone.'
+
+        self.assertEqual(extract_json_from_text(text), '{"filename": "2024-01-01_Invoice"}')
+
+    def test_json_without_fence(self):
+        """Test that a bare object is found anywhere in the text"""
+        text = 'Sure! {"document_type": "Invoice", "tags": ["a", "b"]} Hope that helps.'
+
+        self.assertEqual(orjson.loads(extract_json_from_text(text))["document_type"], "Invoice")
+
+    def test_nested_objects(self):
+        """Test that nested objects are returned whole"""
+        text = '```\n{"a": {"b": {"c": 1}}, "d": 2}\n```'
+
+        self.assertEqual(orjson.loads(extract_json_from_text(text)), {"a": {"b": {"c": 1}}, "d": 2})
+
+    def test_braces_inside_strings(self):
+        """Test that braces and escaped quotes inside strings don't end the object"""
+        obj = {"summary": 'Uses {placeholders} and "quoted }" text', "path": "C:\\dir\\"}
+        text = "```json\n" + orjson.dumps(obj).decode() + "\n```"
+
+        self.assertEqual(orjson.loads(extract_json_from_text(text)), obj)
+
+    def test_truncated_output(self):
+        """Test that a truncated object returns None"""
+        self.assertIsNone(extract_json_from_text('```json\n{"filename": "Invoice", "tags": ["a",'))
+        self.assertIsNone(extract_json_from_text('{"summary": "unterminated }'))
+
+    def test_no_json(self):
+        """Test that text without an object returns None"""
+        self.assertIsNone(extract_json_from_text("I could not classify this document."))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import base64
+import tempfile
+import unittest
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+
+from app.tasks import imap_tasks
+from app.tasks.imap_tasks import save_attachment, fetch_messages, has_gmail_label
+
+
+class FakeMail:
+    """Stands in for imaplib.IMAP4, returning a canned FETCH response."""
+
+    def __init__(self, status, msg_data):
+        self.response = (status, msg_data)
+        self.fetch_args = None
+
+    def fetch(self, message_set, items):
+        self.fetch_args = (message_set, items)
+        return self.response
+
+
+class TestSaveAttachment(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def _saved(self, part):
+        save_attachment(part, self.path)
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def _base64_part(self, encoded_body):
+        raw = (
+            b"Content-Type: application/pdf\r\n"
+            b"Content-Transfer-Encoding: base64\r\n"
+            b'Content-Disposition: attachment; filename="a.pdf"\r\n\r\n'
+            + encoded_body
+        )
+        return message_from_bytes(raw, policy=policy.default)
+
+    def test_base64_round_trip_across_chunk_boundary(self):
+        """Test decoding an attachment whose encoded body spans several chunks"""
+        # Odd length, so the last group is padded; >2 chunks of encoded text
+        data = os.urandom(imap_tasks.BASE64_CHUNK_SIZE * 2 + 1001)
+        msg = EmailMessage()
+        msg.set_content("see attachment")
+        msg.add_attachment(data, maintype="application", subtype="pdf", filename="a.pdf")
+        parsed = message_from_bytes(msg.as_bytes(), policy=policy.default)
+        part = next(p for p in parsed.walk() if p.get_filename())
+
+        self.assertEqual(self._saved(part), data)
+
+    def test_base64_lines_not_multiple_of_four(self):
+        """Test that line lengths that split 4-character groups still decode"""
+        data = os.urandom(5000)
+        encoded = base64.b64encode(data)
+        body = b"\r\n".join(encoded[i:i + 77] for i in range(0, len(encoded), 77))
+        part = self._base64_part(body)
+
+        self.assertEqual(self._saved(part), data)
+
+    def test_base64_missing_padding_matches_email_package(self):
+        """Test that unpadded base64 decodes like get_payload(decode=True)"""
+        part = self._base64_part(b"SGVsbG8gV29ybGQ\r\n")
+
+        self.assertEqual(self._saved(part), part.get_payload(decode=True))
+        self.assertEqual(self._saved(part), b"Hello World")
+
+    def test_base64_with_junk_matches_email_package(self):
+        """Test that characters outside the alphabet are ignored like the email package does"""
+        part = self._base64_part(b"SGVs*bG8g\r\nV29y!bGQ=\r\n")
+
+        self.assertEqual(self._saved(part), part.get_payload(decode=True))
+
+    def test_truncated_base64_falls_back_to_email_package(self):
+        """Test that a dangling single character falls back to lenient decoding"""
+        part = self._base64_part(b"SGVsbG8gV29ybGQhI\r\n")
+
+        self.assertEqual(self._saved(part), part.get_payload(decode=True))
+
+    def test_non_base64_attachment(self):
+        """Test that other transfer encodings are decoded by the email package"""
+        msg = EmailMessage()
+        msg.set_content("plain attachment body\n", subtype="plain",
+                        disposition="attachment", filename="a.txt", cte="quoted-printable")
+
+        self.assertEqual(self._saved(msg), msg.get_payload(decode=True))
+
+
+class TestFetchMessages(unittest.TestCase):
+    def test_gmail_labels_before_and_after_literal(self):
+        """Test FETCH responses with X-GM-LABELS on either side of the literal"""
+        header_1 = b"Message-ID: <one@example.com>\r\n\r\n"
+        header_2 = b"Message-ID: <two@example.com>\r\n\r\n"
+        mail = FakeMail("OK", [
+            (b'1 (X-GM-LABELS ("\\\\Inbox" Ingested) BODY[HEADER.FIELDS (MESSAGE-ID)] {%d}'
+             % len(header_1), header_1),
+            b")",
+            (b"2 (BODY[HEADER.FIELDS (MESSAGE-ID)] {%d}" % len(header_2), header_2),
+            b' X-GM-LABELS ("\\\\Inbox" Receipts))',
+        ])
+
+        fetched = fetch_messages(mail, [b"1", b"2"], "(BODY.PEEK[HEADER] X-GM-LABELS)")
+
+        self.assertEqual(mail.fetch_args[0], b"1,2")
+        self.assertEqual(set(fetched), {b"1", b"2"})
+        meta_1, literal_1 = fetched[b"1"]
+        meta_2, literal_2 = fetched[b"2"]
+        self.assertEqual(literal_1, header_1)
+        self.assertEqual(literal_2, header_2)
+        self.assertTrue(has_gmail_label(meta_1, "Ingested"))
+        self.assertFalse(has_gmail_label(meta_2, "Ingested"))
+        self.assertTrue(has_gmail_label(meta_2, "Receipts"))
+
+    def test_failed_fetch(self):
+        """Test that a non-OK FETCH returns None"""
+        mail = FakeMail("NO", [b"FETCH failed"])
+
+        self.assertIsNone(fetch_messages(mail, [b"1"], "(BODY.PEEK[])"))
+
+    def test_missing_message_is_absent(self):
+        """Test that messages the server didn't return are left out"""
+        mail = FakeMail("OK", [(b"3 (BODY[] {2}", b"hi"), b")"])
+
+        fetched = fetch_messages(mail, [b"3", b"4"], "(BODY.PEEK[])")
+
+        self.assertEqual(list(fetched), [b"3"])
+
+    def test_has_gmail_label_without_labels(self):
+        """Test that a response without X-GM-LABELS has no labels"""
+        self.assertFalse(has_gmail_label(b"1 (BODY[] {2})", "Ingested"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import os
 import tempfile
 import unittest
-from app.utils import hash_file
+from app.utils import hash_file, detect_mime_type
 
 class TestUtils(unittest.TestCase):
     def test_hash_file_empty(self):
@@ -45,5 +45,16 @@ class TestUtils(unittest.TestCase):
         finally:
             os.unlink(tmp_file.name)
 
+    def test_detect_mime_type_pdf_magic(self):
+        """Test that a PDF is detected by content even without a .pdf extension"""
+        with tempfile.NamedTemporaryFile(suffix=".bin", delete=False) as tmp_file:
+            tmp_file.write(b"%PDF-1.7\n%...")
+            tmp_file.flush()
+
+        try:
+            self.assertEqual(detect_mime_type(tmp_file.name), "application/pdf")
+        finally:
+            os.unlink(tmp_file.name)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file